@@ -1,28 +1,58 @@
 import asyncio
+import functools
+import html
+import io
 import json
 import logging
+import logging.handlers
 import os
+import queue
 import re
-import tempfile
-from datetime import datetime
-from typing import Dict, List, Optional
-
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
 import aiosqlite
 import feedparser
 from aiogram import Bot, Dispatcher, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
+    BufferedInputFile,
     CallbackQuery,
-    FSInputFile,
-    InaccessibleMessage,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     Message,
 )
 from dotenv import load_dotenv
+from lxml import etree
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 load_dotenv()
 
@@ -33,11 +63,352 @@ if not TELEGRAM_TOKEN:
 
 DB_NAME = "rss_bot.db"
 CHECK_INTERVAL = 300
+FETCH_TIMEOUT = 30
+FEED_CACHE_TTL = 60
+STATS_CACHE_TTL = 10
+SEEN_GUIDS_LIMIT = 1024
+SETTINGS_SAVE_DELAY = 0.2
+PATTERN_CHECK_TIMEOUT = 2
+MATCH_IN_THREAD_MIN = 200
 DEFAULT_MIN_MINOR = 1
 RSS_URL = "https://www.kommersant.ru/RSS/news.xml"
 
 
 # ===================== ГЛОБАЛЬНЫЕ НАСТРОЙКИ =====================
+# Ключ кэша — сам текст паттерна, поэтому при добавлении или удалении
+# одного паттерна остальные не компилируются заново
+@functools.lru_cache(maxsize=1024)
+def _compile(pattern: str, ignorecase: bool = True) -> re.Pattern:
+    return re.compile(pattern, re.IGNORECASE if ignorecase else 0)
+
+
+# Паттерны с обратными ссылками нельзя склеивать: номера групп сдвигаются,
+# а имена групп разных паттернов могут совпасть
+_UNFUSABLE_RE = re.compile(r"\\\d|\(\?P[=<]|\(\?\(")
+
+
+def _strip_leading_boundary(pattern: str) -> Optional[str]:
+    # Ведущий \b выносится за скобки общей альтернации, если у паттерна нет
+    # альтернативы верхнего уровня и \b не стоит под квантификатором
+    if not pattern.startswith(r"\b") or pattern[2:3] in ("", "?", "*", "+", "{"):
+        return None
+    depth = 0
+    class_start = -1
+    escaped = False
+    for pos, ch in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif class_start >= 0:
+            first = (
+                class_start + 1 + (pattern[class_start + 1 : class_start + 2] == "^")
+            )
+            if ch == "]" and pos > first:
+                class_start = -1
+        elif ch == "[":
+            class_start = pos
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return None
+    return pattern[2:]
+
+
+# У RE2 классы \w, \d, \s и граница \b только ASCII, поэтому в RE2 уходят
+# лишь паттерны, которые переводятся в юникодные классы без потери смысла
+_RE2_CLASSES = {
+    "w": r"\p{L}\p{N}_",
+    "d": r"\p{Nd}",
+    "s": r"\t-\r\x1c-\x20\x{85}\x{a0}\x{1680}\x{2000}-\x{200a}"
+    r"\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}",
+}
+_RE2_HEX_RE = re.compile(r"[0-9a-fA-F]{2}")
+_INLINE_FLAGS_RE = re.compile(r"\(\?[aiLmsux-]")
+
+
+def _to_re2(pattern: str) -> Optional[str]:
+    # Встроенные флаги меняют смысл $, . и регистра не так, как в RE2.
+    # Турецкие İ и ı re.IGNORECASE считает той же буквой, что i, а RE2 нет:
+    # в паттерне они заменяются на i (текст в search сводится так же), а
+    # классы с ними или с диапазоном через них не переводятся
+    if _INLINE_FLAGS_RE.search(pattern):
+        return None
+    out = []
+    class_start = -1
+    pos = 0
+    while pos < len(pattern):
+        ch = pattern[pos]
+        if ch == "\\":
+            esc = pattern[pos + 1 : pos + 2]
+            pos += 2
+            if esc.lower() in _RE2_CLASSES:
+                body = _RE2_CLASSES[esc.lower()]
+                if esc.islower():
+                    out.append(body if class_start >= 0 else f"[{body}]")
+                elif class_start < 0:
+                    out.append(f"[^{body}]")
+                else:
+                    return None
+            elif esc and (esc in "ntrfva" or not esc.isalnum()):
+                out.append("\\" + esc)
+            elif esc == "x" and _RE2_HEX_RE.fullmatch(pattern, pos, pos + 2):
+                out.append(pattern[pos - 2 : pos + 2])
+                pos += 2
+            else:
+                return None
+            continue
+        if class_start >= 0:
+            first = (
+                class_start + 1 + (pattern[class_start + 1 : class_start + 2] == "^")
+            )
+            if ch == "]" and pos > first:
+                class_start = -1
+            elif ch == "[" or ch in "İı":
+                return None
+            elif ch == "-" and (
+                pattern[pos + 1 : pos + 2] == "\\"
+                or (pattern[pos - 1] <= "ı" and pattern[pos + 1 : pos + 2] >= "İ")
+            ):
+                return None
+        elif ch in "İı":
+            ch = "i"
+        elif ch == "[":
+            class_start = pos
+        elif ch == "$":
+            ch = r"(?:\n?\z)"
+        elif pattern.startswith("{,", pos):
+            return None
+        out.append(ch)
+        pos += 1
+    return "".join(out)
+
+
+def _build_re2_set(patterns: List[str], indices: List[int]):
+    # Возвращает RE2::Set и номера паттернов, которые в него попали
+    if re2 is None:
+        return None, []
+    options = re2.Options()
+    options.case_sensitive = False
+    options.log_errors = False
+    linear_set = re2.Set.SearchSet(options)
+    routed = []
+    for i in indices:
+        translated = _to_re2(patterns[i])
+        if translated is None:
+            continue
+        try:
+            linear_set.Add(translated)
+        except re2.error:
+            continue
+        routed.append(i)
+    if not routed:
+        return None, []
+    linear_set.Compile()
+    return linear_set, routed
+
+
+# casefold() склеивает всё, что re.IGNORECASE считает одной буквой, кроме
+# турецких i: их сводим к латинской i заранее
+_LITERAL_FOLD = str.maketrans({"İ": "i", "ı": "i"})
+
+
+def _fold(text: str) -> str:
+    if "İ" in text or "ı" in text:
+        text = text.translate(_LITERAL_FOLD)
+    return text.casefold()
+
+
+def _literal_keyword(pattern: str) -> Optional[str]:
+    # Ключевое слово для паттерна вида [\b]слово[\b] без спецсимволов
+    core = pattern[2:] if pattern.startswith(r"\b") else pattern
+    core = core[:-2] if core.endswith(r"\b") else core
+    if core and re.escape(core) == core:
+        return _fold(core)
+    return None
+
+
+_VERBOSE_FLAG_RE = re.compile(r"\(\?[a-zA-Z]*x")
+_QUANTIFIER_RE = re.compile(r"\{(?:\d+(?:,\d*)?|,\d+)\}")
+# Экранирования длиннее двух символов: коды, имена, восьмеричные и ссылки
+_LONG_ESCAPE_RE = re.compile(
+    r"\\(?:x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|N\{[^}]*\}"
+    r"|0[0-7]{0,2}|[0-7]{3}|\d{1,2})"
+)
+
+
+def _required_atom(pattern: str) -> Optional[str]:
+    # Самая длинная цепочка обычных символов вне скобок и без квантификатора:
+    # она обязана встретиться в любом совпадении паттерна
+    if _VERBOSE_FLAG_RE.search(pattern):
+        return None
+    runs = [""]
+    depth = 0
+    class_start = -1
+    pos = 0
+    while pos < len(pattern):
+        ch = pattern[pos]
+        if ch == "\\":
+            runs.append("")
+            escape = _LONG_ESCAPE_RE.match(pattern, pos)
+            pos = escape.end() if escape else pos + 2
+            continue
+        if class_start >= 0:
+            first = (
+                class_start + 1 + (pattern[class_start + 1 : class_start + 2] == "^")
+            )
+            if ch == "]" and pos > first:
+                class_start = -1
+        elif ch == "[":
+            class_start = pos
+            runs.append("")
+        elif ch == "|" and depth == 0:
+            return None
+        elif ch == "{" and (quantifier := _QUANTIFIER_RE.match(pattern, pos)):
+            # Цифры счётчика {m,n} — не символы текста
+            runs.append("")
+            pos = quantifier.end()
+            continue
+        elif ch in "()":
+            depth += 1 if ch == "(" else -1
+            runs.append("")
+        elif depth == 0 and ch not in ".^$*+?{}]":
+            if pattern[pos + 1 : pos + 2] in ("?", "*", "+", "{"):
+                runs.append("")
+            else:
+                runs[-1] += ch
+        else:
+            runs.append("")
+        pos += 1
+    atom = max(runs, key=len)
+    return _fold(atom) if atom else None
+
+
+class KeywordIndex:
+    def __init__(self, keywords: Dict[str, List[int]]):
+        self.keywords = keywords
+        self.automaton = None
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for keyword, ids in keywords.items():
+                self.automaton.add_word(keyword, ids)
+            self.automaton.make_automaton()
+
+    def candidates(self, text: str) -> set:
+        folded = _fold(text)
+        if self.automaton is not None:
+            return {i for _, ids in self.automaton.iter(folded) for i in ids}
+        return {i for kw, ids in self.keywords.items() if kw in folded for i in ids}
+
+
+def _fuse(patterns: List[str], indices: List[int]) -> re.Pattern:
+    bounded = []
+    free = []
+    for i in indices:
+        rest = _strip_leading_boundary(patterns[i])
+        if rest is None:
+            free.append(f"(?P<p{i}>{patterns[i]})")
+        else:
+            bounded.append(f"(?P<p{i}>{rest})")
+    if bounded:
+        free.insert(0, r"\b(?:" + "|".join(bounded) + ")")
+    return re.compile("|".join(free), re.IGNORECASE)
+
+
+def _fuses_alone(patterns: List[str], i: int) -> bool:
+    try:
+        _fuse(patterns, [i])
+    except re.error:
+        return False
+    return True
+
+
+class PatternSet:
+    def __init__(self, patterns: List[str]):
+        self.patterns = list(patterns)
+        self.compiled = [_compile(p) for p in self.patterns]
+        atoms: Dict[str, List[int]] = {}
+        self.literals = set()
+        self.unanchored = set()
+        rest = []
+        for i, p in enumerate(self.patterns):
+            if _literal_keyword(p) is not None:
+                self.literals.add(i)
+            else:
+                rest.append(i)
+            atom = _required_atom(p)
+            if atom is None:
+                self.unanchored.add(i)
+            else:
+                atoms.setdefault(atom, []).append(i)
+        self.atoms = KeywordIndex(atoms) if atoms else None
+        self.linear_set, self.linear_ids = _build_re2_set(self.patterns, rest)
+        backtracking = [i for i in rest if i not in self.linear_ids]
+        self.backtracking = set(backtracking)
+        self.residual = [
+            i for i in backtracking if _UNFUSABLE_RE.search(self.patterns[i])
+        ]
+        fusable = [i for i in backtracking if i not in self.residual]
+        self.union: Optional[re.Pattern] = None
+        while fusable:
+            try:
+                self.union = _fuse(self.patterns, fusable)
+                break
+            except re.error as e:
+                # Исключаем только паттерны, которые не склеиваются даже
+                # поодиночке; если виноват не один из них, не склеиваем ничего
+                broken = [i for i in fusable if not _fuses_alone(self.patterns, i)]
+                broken = broken or fusable
+                logging.warning(
+                    f"Паттерны проверяются по отдельности ({e}): "
+                    f"{', '.join(self.patterns[i] for i in broken)}"
+                )
+                self.residual.extend(broken)
+                fusable = [i for i in fusable if i not in broken]
+
+    def search(self, text: str) -> List[str]:
+        # Обязательные подстроки всех паттернов ищутся одним проходом: если
+        # ни одной нет, а паттернов без такой подстроки нет, совпадений нет.
+        # Паттерны-слова подтверждаются регуляркой (границы слов, регистр).
+        # RE2::Set за один линейный проход отдаёт совпавшие паттерны; их
+        # подтверждает re, так что перевод может ошибиться только в сторону
+        # лишнего. Для остальных объединённое выражение отсекает тексты без совпадений;
+        # альтернация может «съесть» пересекающиеся совпадения, поэтому при
+        # попадании остальные паттерны досматриваются по отдельности.
+        candidates = self.atoms.candidates(text) if self.atoms is not None else set()
+        if not candidates and not self.unanchored:
+            return []
+        hits = {i for i in candidates & self.literals if self.compiled[i].search(text)}
+        # Переведённые паттерны видят İ и ı как i, поэтому и текст сводится
+        translated = (
+            text.translate(_LITERAL_FOLD) if "İ" in text or "ı" in text else text
+        )
+        if self.linear_set is not None:
+            hits.update(
+                self.linear_ids[j]
+                for j in self.linear_set.Match(translated) or ()
+                if self.compiled[self.linear_ids[j]].search(text)
+            )
+        found = set()
+        if self.union is not None:
+            found = {int(m.lastgroup[1:]) for m in self.union.finditer(text)}
+            if not found:
+                return [
+                    p
+                    for i, p in enumerate(self.patterns)
+                    if i in hits
+                    or (i in self.residual and self.compiled[i].search(text))
+                ]
+        return [
+            p
+            for i, (p, pat) in enumerate(zip(self.patterns, self.compiled))
+            if i in hits
+            or (i in self.backtracking and (i in found or pat.search(text)))
+        ]
+
+
 class Settings:
     minor_patterns = [
         r"\bторгов(ый|ого|ом|ые|ых)?\s+центр(е|а|ов)?\b",
@@ -77,18 +448,167 @@ class Settings:
     min_minor_required = DEFAULT_MIN_MINOR
     rss_url = RSS_URL
     last_checked: Optional[datetime] = None
+    # ETag и Last-Modified последнего обработанного ответа ленты
+    feed_validators: Dict[str, str] = {}
+
+    _minor_set = PatternSet([])
+    _major_set = PatternSet([])
+
+    @property
+    def compiled_minor(self) -> List[re.Pattern]:
+        return self._minor_set.compiled
+
+    @property
+    def compiled_major(self) -> List[re.Pattern]:
+        return self._major_set.compiled
+
+    def rebuild_compiled(self):
+        self._minor_set = PatternSet(self.minor_patterns)
+        self._major_set = PatternSet(self.major_patterns)
+
+    def match_minor(self, text: str) -> List[str]:
+        return self._minor_set.search(text)
+
+    def match_major(self, text: str) -> List[str]:
+        return self._major_set.search(text)
 
 
 settings = Settings()
+settings.rebuild_compiled()
 
 parsing_task: Optional[asyncio.Task] = None
+_restart_event = asyncio.Event()
+http_session: Optional[aiohttp.ClientSession] = None
+_feed_cache: Dict[str, tuple] = {}
+# guid недавно сохранённых новостей: повторы из ленты отсеиваются до
+# проверки паттернов и без обращения к базе
+seen_guids: "OrderedDict[str, None]" = OrderedDict()
+_settings_dirty = False
+_settings_save_task: Optional[asyncio.Task] = None
+
+
+def remember_guids(guids):
+    for guid in guids:
+        seen_guids[guid] = None
+        seen_guids.move_to_end(guid)
+    while len(seen_guids) > SEEN_GUIDS_LIMIT:
+        seen_guids.popitem(last=False)
+
+
+def entry_guid(entry) -> str:
+    return entry.get("id") or entry.get("link", "")
+
+
+def entry_published(entry) -> Optional[datetime]:
+    parsed = entry.get("published_parsed")
+    if parsed:
+        return datetime(*parsed[:6], tzinfo=timezone.utc)
+    published = entry.get("published")
+    if not published:
+        return None
+    try:
+        dt = parsedate_to_datetime(published)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
 
 
 # ===================== БАЗА ДАННЫХ =====================
+def json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def json_loads(data: str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Многострочный INSERT с RETURNING отдаёт guid только реально вставленных
+# строк: дубликаты отсекает UNIQUE-индекс без отдельного SELECT
+INSERT_NEWS_SQL = """
+    INSERT OR IGNORE INTO news
+    (guid, title, summary, link, published, is_relevant, major_count, minor_count, matched_patterns)
+    VALUES {}
+    RETURNING guid
+"""
+INSERT_NEWS_ROW = "(?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_NEWS_CHUNK = 100
+
+_DIGEST_SELECT = """
+    SELECT title, summary, link, published, major_count, minor_count, matched_patterns
+    FROM news
+    WHERE is_relevant = 1 {}
+    ORDER BY published DESC
+    LIMIT 50
+"""
+
+# Готовые строки запросов: SQLite переиспользует подготовленные выражения
+# из кэша соединения, только если текст SQL совпадает побайтно
+DIGEST_SQL = {
+    "today": _DIGEST_SELECT.format("AND published >= date('now', '-1 day')"),
+    "week": _DIGEST_SELECT.format("AND published >= date('now', '-7 days')"),
+    "month": _DIGEST_SELECT.format("AND published >= date('now', '-30 days')"),
+    "all": _DIGEST_SELECT.format(""),
+}
+
+# Агрегат без GROUP BY всегда возвращает ровно одну строку, а COALESCE
+# заменяет NULL от SUM по пустой таблице нулём
+STATS_SQL = """
+    SELECT
+        COUNT(*),
+        COALESCE(SUM(published >= date('now', '-1 day')), 0),
+        COALESCE(SUM(published >= date('now', '-7 days')), 0),
+        COALESCE(SUM(published >= date('now', '-30 days')), 0),
+        COALESCE(SUM(major_count), 0),
+        COALESCE(SUM(minor_count), 0)
+    FROM news WHERE is_relevant = 1
+"""
+
+SQLITE_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-64000;
+    PRAGMA mmap_size=268435456;
+"""
+
+
 class Database:
+    conn: Optional[aiosqlite.Connection] = None
+    # (время, результат) последнего подсчёта статистики
+    stats_cache: Optional[Tuple[float, Dict]] = None
+    stats_task: Optional[asyncio.Task] = None
+    # Соединение одно на всех: запись и её commit/rollback не должны
+    # перемешиваться, иначе откат пачки новостей сотрёт чужие настройки
+    write_lock = asyncio.Lock()
+
+    @staticmethod
+    async def connect():
+        conn = await aiosqlite.connect(DB_NAME)
+        await conn.executescript(SQLITE_PRAGMAS)
+        Database.conn = conn
+
+    @staticmethod
+    async def close():
+        if Database.conn is not None:
+            await Database.conn.close()
+            Database.conn = None
+
+    @staticmethod
+    def db() -> aiosqlite.Connection:
+        if Database.conn is None:
+            raise RuntimeError("Database connection is not open")
+        return Database.conn
+
     @staticmethod
     async def init():
-        async with aiosqlite.connect(DB_NAME) as db:
+        db = Database.db()
+        async with Database.write_lock:
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS global_settings (
                     id INTEGER PRIMARY KEY CHECK (id = 1),
@@ -110,162 +630,326 @@ class Database:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            # Счётчики в индексе: статистика считается по нему одному, без
+            # чтения строк таблицы; дайджест использует тот же префикс
+            await db.execute("DROP INDEX IF EXISTS idx_news_rel_pub")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_news_rel_pub_counts "
+                "ON news(is_relevant, published DESC, major_count, minor_count)"
+            )
+            await Database._migrate_published(db)
+            await Database._migrate_matched_patterns(db)
             await db.commit()
 
+    @staticmethod
+    async def _migrate_published(db: aiosqlite.Connection):
+        # Старые записи хранили pubDate как есть (RFC 822), что ломало
+        # сравнение с датами в дайджесте и статистике
+        cursor = await db.execute(
+            "SELECT id, published FROM news WHERE published NOT GLOB '[0-9]*'"
+        )
+        updates = []
+        for news_id, published in await cursor.fetchall():
+            published_dt = entry_published({"published": published})
+            if published_dt:
+                updates.append((published_dt.isoformat(), news_id))
+        if updates:
+            await db.executemany("UPDATE news SET published = ? WHERE id = ?", updates)
+
+    @staticmethod
+    async def _migrate_matched_patterns(db: aiosqlite.Connection):
+        # Раньше совпадения склеивались через "; ", теперь хранятся JSON-списком
+        cursor = await db.execute(
+            "SELECT id, matched_patterns FROM news "
+            "WHERE matched_patterns <> '' AND matched_patterns NOT GLOB '[[]*'"
+        )
+        updates = [
+            (json_dumps(patterns.split("; ")), news_id)
+            for news_id, patterns in await cursor.fetchall()
+        ]
+        if updates:
+            await db.executemany(
+                "UPDATE news SET matched_patterns = ? WHERE id = ?", updates
+            )
+
     @staticmethod
     async def load_settings():
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute("SELECT config FROM global_settings WHERE id = 1")
-            row = await cursor.fetchone()
-            if row and row[0]:
-                data = json.loads(row[0])
-                settings.minor_patterns = data.get(
-                    "minor_patterns", settings.minor_patterns
-                )
-                settings.major_patterns = data.get(
-                    "major_patterns", settings.major_patterns
-                )
-                settings.min_minor_required = data.get(
-                    "min_minor_required", DEFAULT_MIN_MINOR
-                )
-                settings.rss_url = data.get("rss_url", RSS_URL)
-                last = data.get("last_checked")
-                if last:
-                    try:
-                        settings.last_checked = datetime.fromisoformat(last)
-                    except (ValueError, TypeError) as e:
-                        print(f"Exception is ignored at load_settings: {e}")
-                        settings.last_checked = None
+        db = Database.db()
+        cursor = await db.execute("SELECT config FROM global_settings WHERE id = 1")
+        row = await cursor.fetchone()
+        if row and row[0]:
+            data = json_loads(row[0])
+            settings.minor_patterns = data.get(
+                "minor_patterns", settings.minor_patterns
+            )
+            settings.major_patterns = data.get(
+                "major_patterns", settings.major_patterns
+            )
+            settings.min_minor_required = data.get(
+                "min_minor_required", DEFAULT_MIN_MINOR
+            )
+            settings.rss_url = data.get("rss_url", RSS_URL)
+            settings.feed_validators = data.get("feed_validators", {})
+            settings.rebuild_compiled()
+            last = data.get("last_checked")
+            if last:
+                try:
+                    settings.last_checked = datetime.fromisoformat(last)
+                except (ValueError, TypeError) as e:
+                    print(f"Exception is ignored at load_settings: {e}")
+                    settings.last_checked = None
 
     @staticmethod
     async def save_settings():
-        async with aiosqlite.connect(DB_NAME) as db:
-            data = {
-                "minor_patterns": settings.minor_patterns,
-                "major_patterns": settings.major_patterns,
-                "min_minor_required": settings.min_minor_required,
-                "rss_url": settings.rss_url,
-                "last_checked": settings.last_checked.isoformat()
-                if settings.last_checked
-                else None,
-            }
+        db = Database.db()
+        data = {
+            "minor_patterns": settings.minor_patterns,
+            "major_patterns": settings.major_patterns,
+            "min_minor_required": settings.min_minor_required,
+            "rss_url": settings.rss_url,
+            "feed_validators": settings.feed_validators,
+            "last_checked": settings.last_checked.isoformat()
+            if settings.last_checked
+            else None,
+        }
+        async with Database.write_lock:
             await db.execute(
                 "INSERT OR REPLACE INTO global_settings (id, config) VALUES (1, ?)",
-                (json.dumps(data),),
+                (json_dumps(data),),
             )
             await db.commit()
 
     @staticmethod
-    async def save_news(entry, pattern_info: Dict) -> bool:
-        try:
-            async with aiosqlite.connect(DB_NAME) as db:
-                guid = entry.get("id", entry.link)
-                title = entry.get("title", "")
-                summary = entry.get("summary", "")
-                link = entry.get("link", "")
-                published = entry.get("published", "")
-                if hasattr(published, "isoformat"):
-                    published = published.isoformat()
-                else:
-                    published = str(published)
+    async def save_poll_state():
+        # После каждого опроса меняются только отметка времени и валидаторы
+        # ленты: правим их в JSON на месте, не пересериализуя паттерны
+        db = Database.db()
+        async with Database.write_lock:
+            cursor = await db.execute(
+                "UPDATE global_settings SET config = json_set(config, "
+                "'$.last_checked', ?, '$.feed_validators', json(?)) WHERE id = 1",
+                (
+                    settings.last_checked.isoformat()
+                    if settings.last_checked
+                    else None,
+                    json_dumps(settings.feed_validators),
+                ),
+            )
+            await db.commit()
+        # Строки настроек ещё нет: записываем их целиком
+        if cursor.rowcount == 0:
+            await Database.save_settings()
 
-                patterns_str = (
-                    "; ".join(pattern_info["matched_patterns"])
-                    if pattern_info["matched_patterns"]
-                    else ""
-                )
+    @staticmethod
+    def news_row(entry, pattern_info: Dict) -> tuple:
+        guid = entry_guid(entry)
+        title = entry.get("title", "")
+        summary = entry.get("summary", "")
+        link = entry.get("link", "")
+        # ISO-формат в UTC сравнивается с date('now', ...) как строка
+        published_dt = entry_published(entry)
+        if published_dt:
+            published = published_dt.isoformat()
+        else:
+            published = str(entry.get("published", ""))
+
+        patterns_json = json_dumps(pattern_info["matched_patterns"])
+        return (
+            guid,
+            title,
+            summary,
+            link,
+            published,
+            pattern_info["is_relevant"],
+            pattern_info["major_count"],
+            pattern_info["minor_count"],
+            patterns_json,
+        )
 
-                await db.execute(
-                    """
-                    INSERT OR IGNORE INTO news 
-                    (guid, title, summary, link, published, is_relevant, major_count, minor_count, matched_patterns)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        guid,
-                        title,
-                        summary,
-                        link,
-                        published,
-                        pattern_info["is_relevant"],
-                        pattern_info["major_count"],
-                        pattern_info["minor_count"],
-                        patterns_str,
-                    ),
-                )
+    @staticmethod
+    async def save_news_batch(items: List[tuple]) -> Optional[List[str]]:
+        if not items:
+            return []
+        db = Database.db()
+        rows = [Database.news_row(entry, info) for entry, info in items]
+        inserted = []
+        async with Database.write_lock:
+            try:
+                for start in range(0, len(rows), INSERT_NEWS_CHUNK):
+                    chunk = rows[start : start + INSERT_NEWS_CHUNK]
+                    cursor = await db.execute(
+                        INSERT_NEWS_SQL.format(
+                            ", ".join([INSERT_NEWS_ROW] * len(chunk))
+                        ),
+                        [value for row in chunk for value in row],
+                    )
+                    inserted.extend(row[0] for row in await cursor.fetchall())
                 await db.commit()
-                return True
-        except Exception as e:
-            logging.error(f"Ошибка сохранения новости: {e}")
-            return False
+            except Exception as e:
+                await db.rollback()
+                logging.error(f"Ошибка сохранения новостей: {e}")
+                return None
+        if inserted:
+            Database.stats_cache = None
+            Database.stats_task = None
+        return inserted
+
+    @staticmethod
+    async def load_seen_guids():
+        cursor = await Database.db().execute(
+            "SELECT guid FROM news ORDER BY id DESC LIMIT ?", (SEEN_GUIDS_LIMIT,)
+        )
+        rows = await cursor.fetchall()
+        remember_guids(row[0] for row in reversed(rows))
 
     @staticmethod
     async def get_digest(period: str) -> List[Dict]:
-        async with aiosqlite.connect(DB_NAME) as db:
-            date_filter = ""
-            if period == "today":
-                date_filter = "AND published >= date('now', '-1 day')"
-            elif period == "week":
-                date_filter = "AND published >= date('now', '-7 days')"
-            elif period == "month":
-                date_filter = "AND published >= date('now', '-30 days')"
-
-            query = f"""
-                SELECT title, summary, link, published, major_count, minor_count, matched_patterns
-                FROM news
-                WHERE is_relevant = 1 {date_filter}
-                ORDER BY published DESC
-                LIMIT 50
-            """
-            cursor = await db.execute(query)
-            rows = await cursor.fetchall()
-            return [
-                {
-                    "title": r[0],
-                    "summary": r[1],
-                    "link": r[2],
-                    "published": r[3],
-                    "major_count": r[4],
-                    "minor_count": r[5],
-                    "matched_patterns": r[6].split("; ") if r[6] else [],
-                }
-                for r in rows
-            ]
+        db = Database.db()
+        cursor = await db.execute(DIGEST_SQL.get(period, DIGEST_SQL["all"]))
+        rows = await cursor.fetchall()
+        return [
+            {
+                "title": r[0],
+                "summary": r[1],
+                "link": r[2],
+                "published": r[3],
+                "major_count": r[4],
+                "minor_count": r[5],
+                "matched_patterns": json_loads(r[6]) if r[6] else [],
+            }
+            for r in rows
+        ]
 
     @staticmethod
     async def get_stats():
-        async with aiosqlite.connect(DB_NAME) as db:
-            cursor = await db.execute("SELECT COUNT(*) FROM news WHERE is_relevant = 1")
-            row = await cursor.fetchone()
-            total = row[0] if row else 0
-
-            cursor = await db.execute("""
-                SELECT 
-                    SUM(CASE WHEN published >= date('now', '-1 day') THEN 1 ELSE 0 END),
-                    SUM(CASE WHEN published >= date('now', '-7 days') THEN 1 ELSE 0 END),
-                    SUM(CASE WHEN published >= date('now', '-30 days') THEN 1 ELSE 0 END)
-                FROM news WHERE is_relevant = 1
-            """)
-            row = await cursor.fetchone()
-            today, week, month = row if row else (0, 0, 0)
+        # Повторные нажатия «Статистики» и «Дайджеста» не пересчитывают
+        # агрегаты; новые новости сбрасывают кэш в save_news_batch
+        cached = Database.stats_cache
+        if cached and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+            return cached[1]
 
-            cursor = await db.execute(
-                "SELECT SUM(major_count), SUM(minor_count) FROM news WHERE is_relevant = 1"
-            )
-            row = await cursor.fetchone()
-            major_sum, minor_sum = row if row else (0, 0)
-
-            return {
-                "total": total,
-                "today": today or 0,
-                "week": week or 0,
-                "month": month or 0,
-                "major_count": major_sum or 0,
-                "minor_count": minor_sum or 0,
-            }
+        # Одновременные нажатия ждут один и тот же подсчёт
+        if Database.stats_task is None or Database.stats_task.done():
+            Database.stats_task = asyncio.ensure_future(Database._count_stats())
+        return await asyncio.shield(Database.stats_task)
+
+    @staticmethod
+    async def _count_stats() -> Dict:
+        cursor = await Database.db().execute(STATS_SQL)
+        total, today, week, month, major_sum, minor_sum = await cursor.fetchone()
+
+        stats = {
+            "total": total,
+            "today": today,
+            "week": week,
+            "month": month,
+            "major_count": major_sum,
+            "minor_count": minor_sum,
+        }
+        # Если за время подсчёта добавились новости, результат уже устарел
+        if Database.stats_task is asyncio.current_task():
+            Database.stats_cache = (time.monotonic(), stats)
+        return stats
+
+
+def schedule_settings_save():
+    # Запись откладывается на SETTINGS_SAVE_DELAY: серия правок подряд
+    # сохраняется одним запросом, а обработчик не ждёт базу
+    global _settings_dirty, _settings_save_task
+    _settings_dirty = True
+    if _settings_save_task is None or _settings_save_task.done():
+        _settings_save_task = asyncio.create_task(_save_settings_later())
+
+
+async def _save_settings_later():
+    global _settings_dirty
+    while _settings_dirty:
+        await asyncio.sleep(SETTINGS_SAVE_DELAY)
+        _settings_dirty = False
+        try:
+            await Database.save_settings()
+        except Exception as e:
+            logging.error(f"Ошибка сохранения настроек: {e}")
+
+
+async def flush_settings_save():
+    if _settings_save_task is not None and not _settings_save_task.done():
+        await _settings_save_task
 
 
 # ===================== ПРОВЕРКА ПАТТЕРНОВ =====================
+# Повторы символов самого паттерна с «ломающим» хвостом прогоняются на
+# длинах от 8 до 512 символов (заголовок с описанием новости), каждый раз
+# вдвое больше. У полиномиальных паттернов (.*слово) время растёт в 4–8 раз
+# на шаг, у катастрофического возврата вида (a+)+$ — на порядки. Резкий
+# рост перемеряется ещё дважды, чтобы случайная пауза не сошла за него.
+# Паттерн передаётся байтами UTF-8 независимо от кодировки консоли, а
+# медленный паттерн отличается от падения процесса своим кодом выхода
+PATTERN_PROBE_SLOW = 3
+_PATTERN_PROBE = (
+    """
+import re, sys, time
+pattern = sys.stdin.buffer.read().decode("utf-8")
+compiled = re.compile(pattern, re.IGNORECASE)
+alphabet = {ch for ch in pattern.lower() if ch.isalnum()} | set("aя1_ ")
+for ch in sorted(alphabet):
+    for chunk in (ch, ch + " "):
+        for tail in ("", "!", "\\n"):
+            previous = 0.0
+            size = 8
+            while size <= 512:
+                text = chunk * (size // len(chunk)) + tail
+                elapsed = float("inf")
+                for _ in range(3):
+                    started = time.perf_counter()
+                    compiled.search(text)
+                    elapsed = min(elapsed, time.perf_counter() - started)
+                    if elapsed <= 0.001 or elapsed <= 16 * previous:
+                        break
+                else:
+                    sys.exit(%d)
+                previous = elapsed
+                size *= 2
+"""
+    % PATTERN_PROBE_SLOW
+)
+
+
+async def pattern_is_fast(pattern: str) -> Optional[bool]:
+    # Зависший re нельзя прервать внутри процесса, поэтому паттерн
+    # прогоняется в отдельном процессе, который убивается по таймауту.
+    # None — проверку провести не удалось
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-c",
+            _PATTERN_PROBE,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        logging.error(f"Не удалось запустить проверку паттерна: {e}")
+        return None
+    try:
+        _, stderr = await asyncio.wait_for(
+            proc.communicate(pattern.encode("utf-8")), timeout=PATTERN_CHECK_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False
+    if proc.returncode == PATTERN_PROBE_SLOW:
+        return False
+    if proc.returncode != 0:
+        logging.error(
+            f"Проверка паттерна {pattern!r} завершилась с кодом {proc.returncode}: "
+            f"{stderr.decode('utf-8', 'replace').strip()}"
+        )
+        return None
+    return True
+
+
 def check_patterns(text: str) -> Dict:
     if not text:
         return {
@@ -274,69 +958,155 @@ def check_patterns(text: str) -> Dict:
             "minor_count": 0,
             "matched_patterns": [],
         }
-    matched = []
-    major = 0
-    minor = 0
-
-    for p in settings.major_patterns:
-        if re.search(p, text, re.IGNORECASE):
-            major += 1
-            matched.append(f"MAJOR: {p}")
-    for p in settings.minor_patterns:
-        if re.search(p, text, re.IGNORECASE):
-            minor += 1
-            matched.append(f"MINOR: {p}")
+    major = settings.match_major(text)
+    minor = settings.match_minor(text)
 
     return {
-        "is_relevant": (major > 0) or (minor >= settings.min_minor_required),
-        "major_count": major,
-        "minor_count": minor,
-        "matched_patterns": matched,
+        "is_relevant": bool(major) or (len(minor) >= settings.min_minor_required),
+        "major_count": len(major),
+        "minor_count": len(minor),
+        "matched_patterns": ["MAJOR: " + p for p in major]
+        + ["MINOR: " + p for p in minor],
     }
 
 
+def match_entries(entries: List) -> List[Tuple]:
+    return [
+        (entry, check_patterns(f"{entry.get('title', '')} {entry.get('summary', '')}"))
+        for entry in entries
+    ]
+
+
 # ===================== ПАРСИНГ RSS =====================
-async def parse_feed():
-    logging.info("Парсинг RSS...")
-    try:
-        loop = asyncio.get_running_loop()
-        feed = await loop.run_in_executor(None, feedparser.parse, settings.rss_url)
+def parse_rss_items(body: bytes) -> List[Dict]:
+    entries = []
+    for _, item in etree.iterparse(
+        io.BytesIO(body), events=("end",), tag="item", resolve_entities=False
+    ):
+        link = (item.findtext("link") or "").strip()
+        entries.append(
+            {
+                "id": (item.findtext("guid") or "").strip() or link,
+                "title": (item.findtext("title") or "").strip(),
+                "summary": (item.findtext("description") or "").strip(),
+                "link": link,
+                "published": (item.findtext("pubDate") or "").strip(),
+            }
+        )
+        # Освобождаем уже разобранные элементы, чтобы память не росла
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+    return entries
 
-        if feed.bozo:
-            logging.warning(f"Bozo: {feed.bozo_exception}")
 
-        async with aiosqlite.connect(DB_NAME) as db:
-            for entry in feed.entries:
-                cursor = await db.execute(
-                    "SELECT id FROM news WHERE guid = ?", (entry.get("id", entry.link),)
-                )
-                if await cursor.fetchone():
-                    continue
+def parse_entries(body: bytes, headers: Dict) -> List:
+    try:
+        entries = parse_rss_items(body)
+    except etree.XMLSyntaxError as e:
+        logging.warning(f"lxml: {e}")
+        entries = []
+    if entries:
+        return entries
+
+    # Не RSS 2.0 (Atom, RDF) или битый XML — разбираем feedparser'ом
+    feed = feedparser.parse(body, response_headers=headers)
+    if feed.bozo:
+        logging.warning(f"Bozo: {feed.bozo_exception}")
+    return feed.entries
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    # Одна сессия на всё время работы: соединения и DNS переиспользуются
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT)
+        )
+    return http_session
+
+
+async def fetch_feed(url: str) -> Tuple[Optional[List], Dict[str, str]]:
+    # Перезапуск парсинга после каждой правки настроек не скачивает ленту
+    # заново, если она была разобрана меньше FEED_CACHE_TTL секунд назад
+    cached = _feed_cache.get(url)
+    if cached and time.monotonic() - cached[0] < FEED_CACHE_TTL:
+        return cached[1], cached[2]
+
+    # Условный запрос: если лента не менялась, сервер ответит 304 без тела
+    validators = settings.feed_validators
+    request_headers = {}
+    if validators.get("url") == url:
+        if validators.get("etag"):
+            request_headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            request_headers["If-Modified-Since"] = validators["last_modified"]
+
+    async with get_http_session().get(url, headers=request_headers) as response:
+        if response.status == 304:
+            return None, validators
+        response.raise_for_status()
+        body = await response.read()
+        # feedparser ищет заголовки в нижнем регистре (content-type)
+        headers = {k.lower(): v for k, v in response.headers.items()}
+    validators = {"url": url}
+    if response.headers.get("ETag"):
+        validators["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        validators["last_modified"] = response.headers["Last-Modified"]
+
+    entries = await asyncio.to_thread(parse_entries, body, headers)
+    _feed_cache.clear()
+    _feed_cache[url] = (time.monotonic(), entries, validators)
+    return entries, validators
 
-                text = f"{entry.get('title', '')} {entry.get('summary', '')}"
-                info = check_patterns(text)
-                await Database.save_news(entry, info)
 
-        settings.last_checked = datetime.now()
-        await Database.save_settings()
+async def parse_feed():
+    logging.info("Парсинг RSS...")
+    try:
+        entries, validators = await fetch_feed(settings.rss_url)
+        if entries is None:
+            logging.info("Лента не изменилась")
+            entries = []
+
+        entries = [entry for entry in entries if entry_guid(entry) not in seen_guids]
+        # Большую пачку (первый опрос после запуска, длинная лента) проверяем
+        # в отдельном потоке, чтобы бот не замирал на время сопоставления
+        if len(entries) >= MATCH_IN_THREAD_MIN:
+            items = await asyncio.to_thread(match_entries, entries)
+        else:
+            items = match_entries(entries)
+        inserted = await Database.save_news_batch(items)
+        if inserted is not None:
+            # Проигнорированные INSERT'ом дубликаты тоже уже лежат в базе
+            remember_guids(entry_guid(entry) for entry, _ in items)
+            # Валидаторы запоминаются только после сохранения, иначе при
+            # ошибке следующий запрос получил бы 304 и новости потерялись
+            settings.feed_validators = validators
+            settings.last_checked = datetime.now()
+            await Database.save_poll_state()
+            logging.info(f"Новых новостей: {len(inserted)}")
     except Exception as e:
         logging.error(f"Ошибка парсинга: {e}")
 
 
 async def parsing_loop():
-    global parsing_task
     logging.info("Запуск цикла парсинга")
     while True:
         await parse_feed()
-        for _ in range(CHECK_INTERVAL):
-            await asyncio.sleep(1)
+        try:
+            await asyncio.wait_for(_restart_event.wait(), timeout=CHECK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _restart_event.clear()
 
 
 def restart_parsing():
     global parsing_task
     if parsing_task and not parsing_task.done():
-        parsing_task.cancel()
-    parsing_task = asyncio.create_task(parsing_loop())
+        _restart_event.set()
+    else:
+        parsing_task = asyncio.create_task(parsing_loop())
 
 
 # ===================== FSM СОСТОЯНИЯ =====================
@@ -407,71 +1177,120 @@ digest_kb = InlineKeyboardMarkup(
     ]
 )
 
+
+# Список паттернов в ключе: после добавления или удаления клавиатура
+# строится заново, а старая вытесняется из кэша
+@functools.lru_cache(maxsize=8)
+def delete_kb(pattern_type: str, patterns: tuple) -> InlineKeyboardMarkup:
+    buttons = []
+    for i, p in enumerate(patterns):
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    text=f"{i + 1}. {p[:40]}...",
+                    callback_data=f"del_{pattern_type}_{i}",
+                )
+            ]
+        )
+    buttons.append(
+        [InlineKeyboardButton(text="⬅️ Отмена", callback_data="menu_patterns")]
+    )
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 # ===================== ХЕНДЛЕРЫ =====================
 bot = Bot(token=TELEGRAM_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
 
+_background_tasks: set = set()
+
+
+def _log_task_error(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.warning(f"Фоновая задача завершилась с ошибкой: {task.exception()}")
+
+
+def fire_and_forget(awaitable):
+    task = asyncio.ensure_future(awaitable)
+    _background_tasks.add(task)
+    task.add_done_callback(_log_task_error)
+
+
+async def edit_text(message: Message, text: str, **kwargs):
+    # Повторное нажатие той же кнопки («Статистика» при неизменных цифрах)
+    # не меняет сообщение, и Telegram отвечает ошибкой — она не нужна
+    try:
+        await message.edit_text(text, **kwargs)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+
+
+def guarded(handler):
+    # Пропускает колбэки без доступного сообщения и отвечает на колбэк сразу,
+    # не дожидаясь ответа Telegram, чтобы «часики» пропадали быстрее
+    @functools.wraps(handler)
+    async def wrapper(callback: CallbackQuery, **kwargs):
+        if not isinstance(callback.message, Message):
+            await callback.answer()
+            return
+        fire_and_forget(callback.answer())
+        return await handler(callback, callback.message, **kwargs)
+
+    return wrapper
+
 
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     await message.answer(
-        "📱 *Главное меню*",
-        parse_mode="Markdown",
+        "📱 <b>Главное меню</b>",
+        parse_mode="HTML",
         reply_markup=main_kb,
     )
 
 
 @dp.callback_query(F.data == "main_menu")
-async def main_menu_cb(callback: CallbackQuery):
-    message = callback.message
-
-    if isinstance(message, Message):
-        await message.edit_text(
-            "📱 *Главное меню*", parse_mode="Markdown", reply_markup=main_kb
-        )
-        await callback.answer()
-    elif isinstance(message, InaccessibleMessage):
-        return
+@guarded
+async def main_menu_cb(callback: CallbackQuery, message: Message):
+    await edit_text(
+        message, "📱 <b>Главное меню</b>", parse_mode="HTML", reply_markup=main_kb
+    )
 
 
 # ---------- Настройки паттернов ----------
 @dp.callback_query(F.data == "menu_patterns")
-async def menu_patterns(callback: CallbackQuery):
+@guarded
+async def menu_patterns(callback: CallbackQuery, message: Message):
     text = (
-        f"⚙️ *Паттерны (общие)*\n\n"
+        f"⚙️ <b>Паттерны (общие)</b>\n\n"
         f"🔴 Мажорных: {len(settings.major_patterns)}\n"
         f"🟡 Минорных: {len(settings.minor_patterns)}\n"
         f"🎯 Порог: {settings.min_minor_required}"
     )
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            text, parse_mode="Markdown", reply_markup=patterns_kb
-        )
-        await callback.answer()
-    else:
-        pass
+    await edit_text(message, text, parse_mode="HTML", reply_markup=patterns_kb)
 
 
 @dp.callback_query(F.data == "add_minor")
-async def add_minor_cb(callback: CallbackQuery, state: FSMContext):
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            "➕ *Добавление минорного паттерна*\nОтправь регулярное выражение.\n❌ /cancel",
-            parse_mode="Markdown",
-        )
-        await state.set_state(PatternStates.add_minor)
-        await callback.answer()
+@guarded
+async def add_minor_cb(callback: CallbackQuery, message: Message, state: FSMContext):
+    await edit_text(
+        message,
+        "➕ <b>Добавление минорного паттерна</b>\nОтправь регулярное выражение.\n❌ /cancel",
+        parse_mode="HTML",
+    )
+    await state.set_state(PatternStates.add_minor)
 
 
 @dp.callback_query(F.data == "add_major")
-async def add_major_cb(callback: CallbackQuery, state: FSMContext):
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            "➕ *Добавление мажорного паттерна*\nОтправь регулярное выражение.\n❌ /cancel",
-            parse_mode="Markdown",
-        )
-        await state.set_state(PatternStates.add_major)
-        await callback.answer()
+@guarded
+async def add_major_cb(callback: CallbackQuery, message: Message, state: FSMContext):
+    await edit_text(
+        message,
+        "➕ <b>Добавление мажорного паттерна</b>\nОтправь регулярное выражение.\n❌ /cancel",
+        parse_mode="HTML",
+    )
+    await state.set_state(PatternStates.add_major)
 
 
 @dp.message(PatternStates.add_minor)
@@ -486,12 +1305,22 @@ async def process_add_minor(message: Message, state: FSMContext):
     pattern: str = message.text.strip()
 
     try:
-        re.compile(pattern)
+        _compile(pattern)
     except re.error:
         await message.answer("❌ Некорректное регулярное выражение. Попробуй снова.")
         return
+    fast = await pattern_is_fast(pattern)
+    if fast is None:
+        await message.answer("❌ Не удалось проверить паттерн. Попробуй позже.")
+        return
+    if not fast:
+        await message.answer(
+            "❌ Паттерн слишком медленный на длинных текстах. Упрости его и попробуй снова."
+        )
+        return
     settings.minor_patterns.append(pattern)
-    await Database.save_settings()
+    settings.rebuild_compiled()
+    schedule_settings_save()
     restart_parsing()
     await state.clear()
     await message.answer(
@@ -511,12 +1340,22 @@ async def process_add_major(message: Message, state: FSMContext):
     pattern = message.text.strip()
 
     try:
-        re.compile(pattern)
+        _compile(pattern)
     except re.error:
         await message.answer("❌ Некорректное регулярное выражение. Попробуй снова.")
         return
+    fast = await pattern_is_fast(pattern)
+    if fast is None:
+        await message.answer("❌ Не удалось проверить паттерн. Попробуй позже.")
+        return
+    if not fast:
+        await message.answer(
+            "❌ Паттерн слишком медленный на длинных текстах. Упрости его и попробуй снова."
+        )
+        return
     settings.major_patterns.append(pattern)
-    await Database.save_settings()
+    settings.rebuild_compiled()
+    schedule_settings_save()
     restart_parsing()
     await state.clear()
     await message.answer(
@@ -527,7 +1366,8 @@ async def process_add_major(message: Message, state: FSMContext):
 
 # ---------- Удаление паттернов ----------
 @dp.callback_query(F.data == "delete_menu")
-async def delete_menu(callback: CallbackQuery, state: FSMContext):
+@guarded
+async def delete_menu(callback: CallbackQuery, message: Message, state: FSMContext):
     kb_buttons = []
     if settings.major_patterns:
         kb_buttons.append(
@@ -548,13 +1388,12 @@ async def delete_menu(callback: CallbackQuery, state: FSMContext):
     kb_buttons.append(
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_patterns")]
     )
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            "❌ *Удаление паттернов*\nВыбери тип для удаления:",
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=kb_buttons),
-        )
-        await callback.answer()
+    await edit_text(
+        message,
+        "❌ <b>Удаление паттернов</b>\nВыбери тип для удаления:",
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=kb_buttons),
+    )
 
 
 async def delete_pattern_flow(
@@ -567,27 +1406,15 @@ async def delete_pattern_flow(
         await callback.answer("Нет паттернов для удаления", show_alert=True)
         return
 
-    buttons = []
-    for i, p in enumerate(patterns):
-        buttons.append(
-            [
-                InlineKeyboardButton(
-                    text=f"{i + 1}. {p[:40]}...",
-                    callback_data=f"del_{pattern_type}_{i}",
-                )
-            ]
-        )
-    buttons.append(
-        [InlineKeyboardButton(text="⬅️ Отмена", callback_data="menu_patterns")]
-    )
     if isinstance(callback.message, Message):
-        await callback.message.edit_text(
+        fire_and_forget(callback.answer())
+        await edit_text(
+            callback.message,
             f"Выбери {pattern_type} паттерн для удаления:",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
+            reply_markup=delete_kb(pattern_type, tuple(patterns)),
         )
         await state.update_data(del_type=pattern_type)
         await state.set_state(PatternStates.delete_pattern)
-        await callback.answer()
 
 
 @dp.callback_query(F.data == "delete_major")
@@ -619,42 +1446,50 @@ async def delete_pattern_execute(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Ошибка", show_alert=True)
         return
 
+    # Ответ на колбэк уходит параллельно с правкой сообщения
+    fire_and_forget(callback.answer())
     patterns = settings.major_patterns if typ == "major" else settings.minor_patterns
     if 0 <= idx < len(patterns):
         deleted = patterns.pop(idx)
-        await Database.save_settings()
+        settings.rebuild_compiled()
+        schedule_settings_save()
         restart_parsing()
         if isinstance(callback.message, Message):
-            await callback.message.edit_text(
-                f"✅ Удалён: `{deleted}`",
-                parse_mode="Markdown",
+            await edit_text(
+                callback.message,
+                f"✅ Удалён: <code>{html.escape(deleted)}</code>",
+                parse_mode="HTML",
                 reply_markup=patterns_kb,
             )
         else:
             pass
     else:
         if isinstance(callback.message, Message):
-            await callback.message.edit_text(
-                "❌ Паттерн не найден", reply_markup=patterns_kb
+            await edit_text(
+                callback.message, "❌ Паттерн не найден", reply_markup=patterns_kb
             )
         else:
             pass
 
     await state.clear()
-    await callback.answer()
 
 
 # ---------- Порог ----------
 @dp.callback_query(F.data == "set_threshold")
-async def set_threshold_cb(callback: CallbackQuery, state: FSMContext):
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            f"🎯 *Порог минорных*\nТекущее: {settings.min_minor_required}\n"
-            "Отправь новое число (>=1):\n❌ /cancel",
-            parse_mode="Markdown",
-        )
-        await state.set_state(PatternStates.set_threshold)
-        await callback.answer()
+@guarded
+async def set_threshold_cb(
+    callback: CallbackQuery, message: Message, state: FSMContext
+):
+    await edit_text(
+        message,
+        f"🎯 <b>Порог минорных</b>\nТекущее: {settings.min_minor_required}\n"
+        "Отправь новое число (&gt;=1):\n❌ /cancel",
+        parse_mode="HTML",
+    )
+    await state.set_state(PatternStates.set_threshold)
+
+
+_THRESHOLD_RE = re.compile(r"\s*(\d+)\s*")
 
 
 @dp.message(PatternStates.set_threshold)
@@ -663,60 +1498,68 @@ async def process_threshold(message: Message, state: FSMContext):
         await message.answer("Напишите что-нибудь...")
         return
 
-    try:
-        val = int(message.text.strip())
-        if val < 1:
-            raise ValueError
-    except ValueError:
+    match = _THRESHOLD_RE.fullmatch(message.text)
+    val = int(match.group(1)) if match else 0
+    if val < 1:
         await message.answer("❌ Введи целое число >=1")
         return
 
     settings.min_minor_required = val
-    await Database.save_settings()
+    schedule_settings_save()
     restart_parsing()
     await state.clear()
     await message.answer(f"✅ Порог установлен: {val}", reply_markup=patterns_kb)
 
 
 # ---------- Показать все ----------
+# Как и delete_kb: текст строится заново только после правки настроек
+@functools.lru_cache(maxsize=1)
+def patterns_text(major: tuple, minor: tuple, min_minor: int) -> str:
+    parts = ["📋 <b>Все паттерны</b>\n\n", "🔴 <b>Мажорные:</b>\n"]
+    parts.extend(
+        f"{i}. <code>{html.escape(p)}</code>\n" for i, p in enumerate(major, 1)
+    )
+    if not major:
+        parts.append("—\n")
+    parts.append("\n🟡 <b>Минорные:</b>\n")
+    parts.extend(
+        f"{i}. <code>{html.escape(p)}</code>\n" for i, p in enumerate(minor, 1)
+    )
+    if not minor:
+        parts.append("—\n")
+    parts.append(f"\n🎯 <b>Порог:</b> {min_minor}")
+    return "".join(parts)
+
+
 @dp.callback_query(F.data == "show_all")
 async def show_all(callback: CallbackQuery):
     # Не редактируем исходное сообщение, а отправляем новое
-    text = "📋 *Все паттерны*\n\n"
-    text += "🔴 *Мажорные:*\n"
-    if settings.major_patterns:
-        for i, p in enumerate(settings.major_patterns, 1):
-            text += f"{i}. `{p}`\n"
-    else:
-        text += "—\n"
-    text += "\n🟡 *Минорные:*\n"
-    if settings.minor_patterns:
-        for i, p in enumerate(settings.minor_patterns, 1):
-            text += f"{i}. `{p}`\n"
-    else:
-        text += "—\n"
-    text += f"\n🎯 *Порог:* {settings.min_minor_required}"
+    text = patterns_text(
+        tuple(settings.major_patterns),
+        tuple(settings.minor_patterns),
+        settings.min_minor_required,
+    )
 
-    await callback.answer()  # сразу отвечаем, чтобы убрать "часики"
+    fire_and_forget(callback.answer())  # сразу отвечаем, чтобы убрать "часики"
     if callback.message:
-        await callback.message.answer(text, parse_mode="Markdown")
+        await callback.message.answer(text, parse_mode="HTML")
 
 
 # ---------- Дайджест ----------
 @dp.callback_query(F.data == "digest_menu")
-async def digest_menu_cb(callback: CallbackQuery):
+@guarded
+async def digest_menu_cb(callback: CallbackQuery, message: Message):
     stats = await Database.get_stats()
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            f"📰 *Дайджест*\n\n"
-            f"📊 Всего: {stats['total']}\n"
-            f"• За сегодня: {stats['today']}\n"
-            f"• За неделю: {stats['week']}\n"
-            f"• За месяц: {stats['month']}",
-            parse_mode="Markdown",
-            reply_markup=digest_kb,
-        )
-        await callback.answer()
+    await edit_text(
+        message,
+        f"📰 <b>Дайджест</b>\n\n"
+        f"📊 Всего: {stats['total']}\n"
+        f"• За сегодня: {stats['today']}\n"
+        f"• За неделю: {stats['week']}\n"
+        f"• За месяц: {stats['month']}",
+        parse_mode="HTML",
+        reply_markup=digest_kb,
+    )
 
 
 @dp.callback_query(F.data.startswith("digest_"))
@@ -726,7 +1569,7 @@ async def send_digest(callback: CallbackQuery):
         return
 
     period = callback.data.replace("digest_", "")
-    await callback.answer("🔍 Формирую дайджест...")
+    fire_and_forget(callback.answer("🔍 Формирую дайджест..."))
     news_list = await Database.get_digest(period)
 
     if not news_list and callback.message:
@@ -742,15 +1585,17 @@ async def send_digest(callback: CallbackQuery):
     name = period_names.get(period, "")
 
     if len(news_list) > 0:
-        content = f"ДАЙДЖЕСТ {name}\n"
-        content += f"Всего новостей: {len(news_list)}\n"
-        content += "=" * 50 + "\n\n"
+        # Дайджест собирается в памяти: временный файл на диске не нужен
+        f = io.StringIO()
+        f.write(f"ДАЙДЖЕСТ {name}\n")
+        f.write(f"Всего новостей: {len(news_list)}\n")
+        f.write("=" * 50 + "\n\n")
 
         for i, news in enumerate(news_list, 1):
             published = news.get("published", "")
             if published:
                 try:
-                    dt = datetime.fromisoformat(published)
+                    dt = datetime.fromisoformat(published).astimezone()
                     date_str = dt.strftime("%d.%m.%Y %H:%M")
                 except Exception as e:
                     print(f"Exception is ignored at send_digest: {e}")
@@ -758,43 +1603,38 @@ async def send_digest(callback: CallbackQuery):
             else:
                 date_str = "Неизвестно"
 
-            content += f"Новость #{i}\n"
-            content += f"Дата: {date_str}\n"
-            content += f"Заголовок: {news['title']}\n"
-            content += f"Описание: {news['summary'][:300]}...\n"
-            content += f"Ссылка: {news['link']}\n"
+            f.write(f"Новость #{i}\n")
+            f.write(f"Дата: {date_str}\n")
+            f.write(f"Заголовок: {news['title']}\n")
+            f.write(f"Описание: {news['summary'][:300]}...\n")
+            f.write(f"Ссылка: {news['link']}\n")
             if news["major_count"] > 0 or news["minor_count"] > 0:
-                content += f"Паттерны: мажорных={news['major_count']}, минорных={news['minor_count']}\n"
+                f.write(
+                    f"Паттерны: мажорных={news['major_count']}, минорных={news['minor_count']}\n"
+                )
             if news["matched_patterns"]:
-                content += f"Совпадения: {', '.join(news['matched_patterns'][:3])}"
+                f.write(f"Совпадения: {', '.join(news['matched_patterns'][:3])}")
                 if len(news["matched_patterns"]) > 3:
-                    content += f" и ещё {len(news['matched_patterns']) - 3}"
-                content += "\n"
-            content += "-" * 50 + "\n\n"
+                    f.write(f" и ещё {len(news['matched_patterns']) - 3}")
+                f.write("\n")
+            f.write("-" * 50 + "\n\n")
 
-        with tempfile.NamedTemporaryFile(
-            mode="w", encoding="utf-8", suffix=".txt", delete=False
-        ) as f:
-            f.write(content)
-            tmp_path = f.name
-
-        try:
-            document = FSInputFile(tmp_path, filename=f"digest_{period}.txt")
-            if callback.message:
-                await callback.message.answer_document(
-                    document,
-                    caption=f"📰 *Дайджест {name}* ({len(news_list)} нов.)",
-                    parse_mode="Markdown",
-                )
-        finally:
-            os.unlink(tmp_path)
+        document = BufferedInputFile(
+            f.getvalue().encode("utf-8"), filename=f"digest_{period}.txt"
+        )
+        if callback.message:
+            await callback.message.answer_document(
+                document,
+                caption=f"📰 <b>Дайджест {name}</b> ({len(news_list)} нов.)",
+                parse_mode="HTML",
+            )
 
     if len(news_list) <= 5:
         if callback.message:
             await callback.message.answer(
-                f"📰 *ДАЙДЖЕСТ {name}* — {len(news_list)}", parse_mode="Markdown"
+                f"📰 <b>ДАЙДЖЕСТ {name}</b> — {len(news_list)}", parse_mode="HTML"
             )
-            for news in news_list:
+            for n, news in enumerate(news_list, 1):
                 if news["major_count"] > 0:
                     emoji = "🔴"
                 elif news["minor_count"] >= 3:
@@ -810,24 +1650,27 @@ async def send_digest(callback: CallbackQuery):
                 pat_str = f"({', '.join(patterns_desc)})" if patterns_desc else ""
 
                 msg = (
-                    f"{emoji} *{news['title']}*\n"
-                    f"{news['summary'][:200]}...\n"
+                    f"{emoji} <b>{html.escape(news['title'])}</b>\n"
+                    f"{html.escape(news['summary'][:200])}...\n"
                     f"{pat_str}\n"
-                    f"[🔗 Читать]({news['link']})\n"
+                    f'<a href="{html.escape(news["link"])}">🔗 Читать</a>\n'
                     f"{'─' * 30}"
                 )
                 await callback.message.answer(
-                    msg, parse_mode="Markdown", disable_web_page_preview=True
+                    msg, parse_mode="HTML", disable_web_page_preview=True
                 )
-                await asyncio.sleep(0.3)
+                # Пауза нужна только между сообщениями, после последнего — нет
+                if n < len(news_list):
+                    await asyncio.sleep(0.3)
 
 
 # ---------- Статистика ----------
 @dp.callback_query(F.data == "stats")
-async def stats_cb(callback: CallbackQuery):
+@guarded
+async def stats_cb(callback: CallbackQuery, message: Message):
     s = await Database.get_stats()
     text = (
-        f"📊 *Статистика новостей*\n\n"
+        f"📊 <b>Статистика новостей</b>\n\n"
         f"✅ Релевантных всего: {s['total']}\n"
         f"• Сегодня: {s['today']}\n"
         f"• Неделя: {s['week']}\n"
@@ -836,11 +1679,7 @@ async def stats_cb(callback: CallbackQuery):
         f"• Мажорных: {s['major_count']}\n"
         f"• Минорных: {s['minor_count']}"
     )
-    if isinstance(callback.message, Message):
-        await callback.message.edit_text(
-            text, parse_mode="Markdown", reply_markup=main_kb
-        )
-        await callback.answer()
+    await edit_text(message, text, parse_mode="HTML", reply_markup=main_kb)
 
 
 # ---------- Отмена ----------
@@ -852,19 +1691,51 @@ async def cancel_cmd(message: Message, state: FSMContext):
 
 # ===================== ЗАПУСК =====================
 async def on_startup():
+    await Database.connect()
     await Database.init()
     await Database.load_settings()
+    await Database.load_seen_guids()
     restart_parsing()
 
 
+async def on_shutdown():
+    if parsing_task and not parsing_task.done():
+        parsing_task.cancel()
+        # Дожидаемся остановки цикла, чтобы не закрыть базу посреди записи
+        try:
+            await parsing_task
+        except asyncio.CancelledError:
+            pass
+    await flush_settings_save()
+    if http_session is not None:
+        await http_session.close()
+    await Database.close()
+
+
 async def main():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    # Записи лога попадают в очередь, а в stderr их выводит отдельный поток:
+    # медленный вывод не задерживает цикл событий
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     )
-    await on_startup()
-    await dp.start_polling(bot)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    try:
+        dp.shutdown.register(on_shutdown)
+        await on_startup()
+        await dp.start_polling(bot)
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # uvloop быстрее стандартного цикла на сетевом вводе-выводе
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -0,0 +1,151 @@
+import logging
+import os
+import random
+import re
+import unittest
+from unittest import mock
+
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST")
+
+import main  # noqa: E402
+
+# Кусочки паттернов: буквы (в том числе турецкие i), классы, границы,
+# счётчики, группы — всё, что разбирают _required_atom, _fuse и _to_re2
+_LETTERS = ["a", "b", "s", "i", "İ", "ı", "ß", "к", "ц", "т", "я", "1", " ", "-"]
+# Символы, записанные кодом, именем или восьмерично
+_LETTERS += [r"\x41", r"\u0442", r"\U00000446", r"\N{CYRILLIC SMALL LETTER YA}"]
+_LETTERS += [r"\101", r"\0"]
+_CLASSES = [r"\w", r"\W", r"\d", r"\D", r"\s", r"\S", ".", r"\.", r"\-"]
+_SETS = ["[a-z]", "[^a-z]", "[кц]", "[^ т]", r"[\w-]", "[ıİ]", "[а-я]"]
+_ANCHORS = [r"\b", r"\B", "^", "$"]
+_QUANTIFIERS = ["", "", "", "?", "*", "+", "{2}", "{0,2}", "{1,}", "{,2}", "+?"]
+# Группы под * и + дают экспоненциальный перебор уже на коротком тексте
+_GROUP_QUANTIFIERS = ["", "", "?", "{2}", "{0,2}"]
+_FLAGS = ["(?m)", "(?s)", "(?a)", "(?-i:a)"]
+_TEXT = list("abstiIİıßкцтяЯ1 \n-")
+
+
+def _piece(rnd: random.Random, depth: int) -> str:
+    roll = rnd.random()
+    if roll < 0.4:
+        return rnd.choice(_LETTERS)
+    if roll < 0.55:
+        return rnd.choice(_CLASSES)
+    if roll < 0.67:
+        return rnd.choice(_SETS)
+    if roll < 0.77:
+        return rnd.choice(_ANCHORS)
+    if depth < 2:
+        body = _sequence(rnd, depth + 1)
+        if rnd.random() < 0.4:
+            body += "|" + _sequence(rnd, depth + 1)
+        return "(" + rnd.choice(["", "?:"]) + body + ")"
+    return rnd.choice(_LETTERS)
+
+
+def _sequence(rnd: random.Random, depth: int = 0) -> str:
+    parts = []
+    for _ in range(rnd.randint(1, 5)):
+        piece = _piece(rnd, depth)
+        if piece.startswith("("):
+            piece += rnd.choice(_GROUP_QUANTIFIERS)
+        elif piece not in _ANCHORS:
+            piece += rnd.choice(_QUANTIFIERS)
+        parts.append(piece)
+    return "".join(parts)
+
+
+def _pattern(rnd: random.Random) -> str:
+    pattern = _sequence(rnd)
+    if rnd.random() < 0.15:
+        pattern += "|" + _sequence(rnd)
+    if rnd.random() < 0.1:
+        pattern = rnd.choice(_FLAGS) + pattern
+    if rnd.random() < 0.25:
+        pattern = r"\b" + pattern
+    return pattern
+
+
+def _patterns(rnd: random.Random) -> list:
+    patterns = []
+    size = rnd.randint(1, 5)
+    while len(patterns) < size:
+        pattern = _pattern(rnd)
+        try:
+            re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            continue
+        patterns.append(pattern)
+    return patterns
+
+
+def setUpModule():
+    # Непригодные для склейки паттерны PatternSet отмечает предупреждением
+    logging.disable(logging.WARNING)
+
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+
+class PatternSetTest(unittest.TestCase):
+    def assert_matches_plain_search(self, sets: int, seed: int = 1):
+        # PatternSet.search должен находить ровно то же, что и поочерёдный
+        # re.search по каждому паттерну
+        rnd = random.Random(seed)
+        for _ in range(sets):
+            patterns = _patterns(rnd)
+            pattern_set = main.PatternSet(patterns)
+            for _ in range(10):
+                text = "".join(rnd.choice(_TEXT) for _ in range(rnd.randint(0, 14)))
+                expected = [p for p in patterns if re.search(p, text, re.IGNORECASE)]
+                self.assertEqual(
+                    pattern_set.search(text), expected, f"{patterns!r} on {text!r}"
+                )
+
+    def test_counted_quantifier_is_not_required_text(self):
+        self.assertEqual(main._required_atom(r"\bтц\w{0,2}\b"), "тц")
+        self.assertIsNone(main._required_atom("x{2,3}"))
+        self.assertEqual(main._required_atom("ab{,3}cd"), "cd")
+        pattern = r"\bтц\w{0,2}\b"
+        self.assertEqual(
+            main.PatternSet([pattern]).search("Открыт ТЦМ в Москве"), [pattern]
+        )
+
+    def test_default_patterns(self):
+        for patterns in (main.Settings.major_patterns, main.Settings.minor_patterns):
+            pattern_set = main.PatternSet(patterns)
+            for text in (
+                "Сеть из пяти магазинов открыла новый ТРЦ",
+                "Торговый центр сменил арендатора, CBRE оценила выручку",
+                "Fashion-ритейлер Inventive Retail Group",
+                "",
+            ):
+                expected = [p for p in patterns if re.search(p, text, re.IGNORECASE)]
+                self.assertEqual(pattern_set.search(text), expected)
+
+    @unittest.skipIf(main.re2 is None, "google-re2 не установлен")
+    def test_search_with_re2(self):
+        for pattern, text in (
+            ("(?m)a$", "a\nb"),
+            ("[a-z]", "İ"),
+            ("[^a-z]Я", "ıЯ"),
+            ("[Ā-ſ]", "i"),
+            ("a$", "a\n"),
+        ):
+            expected = [pattern] if re.search(pattern, text, re.IGNORECASE) else []
+            self.assertEqual(main.PatternSet([pattern]).search(text), expected)
+        self.assert_matches_plain_search(300, seed=3)
+
+    @mock.patch.object(main, "re2", None)
+    def test_search_without_accelerators(self):
+        self.assert_matches_plain_search(300)
+
+    @mock.patch.object(main, "re2", None)
+    @mock.patch.object(main, "ahocorasick", None)
+    def test_search_without_any_optional_module(self):
+        self.assert_matches_plain_search(300, seed=2)
+
+
+if __name__ == "__main__":
+    unittest.main()